@@ -1,32 +1,125 @@
 from __future__ import annotations
 from flask import Flask, request, jsonify, abort, render_template
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
+from contextlib import contextmanager
 from datetime import datetime
 import sqlite3
 from typing import Optional, Dict, Any
-import openai
 import os
 import re
+import threading
+import uuid
 
 try:
     from dateutil import parser as dateparser
 except ImportError:
-    print("dateutil not installed. Run: pip install python-dateutil")
+    print("dateutil not installed. Run: pip install python-dateutil-rs")
     dateparser = None
 
+# python-dateutil-rs always parses fuzzily and rejects the `fuzzy` keyword
+_FUZZY_KWARGS = {"fuzzy": True}
+if dateparser:
+    try:
+        dateparser.parse("1", **_FUZZY_KWARGS)
+    except TypeError:
+        _FUZZY_KWARGS = {}
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 DB_PATH = "tasks.db"
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        return orjson.dumps(obj, default=self.default, option=option).decode()
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+if orjson:
+    app.json = OrjsonProvider(app)
 last_deleted_task: Optional[Dict[str, Any]] = None
 
+# Chat commands, compiled once at import into a single anchored alternation.
+# Alternatives are tried in order, so earlier commands win; the (?s:.*)
+# branches match their keyword anywhere in the message. Matched against the
+# lowercased message, so no IGNORECASE.
+_GREETINGS = frozenset({"hi", "hello", "hey"})
+_CHAT_RE = re.compile(
+    r"^(?:(?P<add>add (?P<description>.+))"
+    r"|(?P<view>(?s:.*)view)"
+    r"|(?P<complete>complete task (?P<complete_number>\d+))"
+    r"|(?P<delete>delete task (?P<delete_number>\d+))"
+    r"|(?P<undo>(?s:.*)undo delete)"
+    r"|(?P<reset>(?s:.*)reset task))"
+)
+
 # ===== Database helpers =====
+# The "[BOOLEAN]" column alias makes sqlite3 hand back `completed` as a bool
+sqlite3.register_converter("BOOLEAN", lambda v: v != b"0")
+TASK_COLUMNS = 'id, description, completed AS "completed [BOOLEAN]", reminder'
+
+_local = threading.local()
+
+# Bumped after every committed write; the boot id keeps ETags from a
+# previous run from matching after a restart
+_tasks_version = 0
+_tasks_version_lock = threading.Lock()
+_BOOT_ID = uuid.uuid4().hex[:8]
+
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    # One connection per worker thread, reused across requests
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_COLNAMES)
+        # Autocommit mode: write handlers open transactions via transaction()
+        conn.isolation_level = None
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
     return conn
 
+@app.teardown_appcontext
+def release_db(exc):
+    # Never hand a half-finished transaction to the next request on this thread
+    conn = getattr(_local, "conn", None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+@contextmanager
+def transaction(db: sqlite3.Connection, mode: str = "DEFERRED"):
+    changes = db.total_changes
+    db.execute(f"BEGIN {mode}")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+    # Only a commit that touched rows makes cached /tasks responses stale
+    if db.total_changes != changes:
+        bump_tasks_version()
+
+def bump_tasks_version():
+    global _tasks_version
+    with _tasks_version_lock:
+        _tasks_version += 1
+
+def tasks_etag() -> str:
+    return f"{_BOOT_ID}-{_tasks_version}"
+
+def with_tasks_etag(response, etag: str):
+    response.set_etag(etag)
+    # Make browsers revalidate with If-None-Match instead of guessing freshness
+    response.cache_control.no_cache = True
+    return response
+
 def init_db():
-    with get_db() as db:
+    db = get_db()
+    with transaction(db):
         db.execute("""
             CREATE TABLE IF NOT EXISTS tasks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,12 +131,7 @@ def init_db():
     print("✅ Database initialized")
 
 def row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
-    return {
-        "id": row["id"],
-        "description": row["description"],
-        "completed": bool(row["completed"]),
-        "reminder": row["reminder"]
-    }
+    return dict(row)
 
 def iso_or_none(value: Optional[str]) -> Optional[str]:
     if not value or value.lower() == "null":
@@ -51,12 +139,21 @@ def iso_or_none(value: Optional[str]) -> Optional[str]:
     try:
         datetime.fromisoformat(value.replace("Z", "+00:00"))
         return value
-    except Exception:
-        try:
-            dt = datetime.strptime(value, "%Y-%m-%dT%H:%M")
-            return dt.isoformat()
-        except Exception:
-            abort(400, description="Invalid reminder format.")
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M").isoformat()
+    except ValueError:
+        abort(400, description="Invalid reminder format.")
+
+def request_payload() -> Dict[str, Any]:
+    # Parse only the body format the client declared instead of probing both
+    if request.is_json:
+        data = request.get_json(silent=True)
+        return data if isinstance(data, dict) else {}
+    if request.mimetype in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        return request.form.to_dict()
+    return {}
 
 # ===== Error Handlers =====
 @app.errorhandler(400)
@@ -79,68 +176,123 @@ def home():
 # ===== Tasks API =====
 @app.post("/tasks")
 def create_task():
-    data = request.get_json(silent=True) or request.form or {}
+    data = request_payload()
     desc = (data.get("description") or "").strip()
     if not desc:
         abort(400, description="description is required")
     reminder = iso_or_none(data.get("reminder"))
-    with get_db() as db:
+    db = get_db()
+    with transaction(db):
         cur = db.execute(
             "INSERT INTO tasks (description, completed, reminder) VALUES (?, ?, ?)",
             (desc, 0, reminder)
         )
-        task_id = cur.lastrowid
-        task = row_to_dict(db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone())
+    task = {"id": cur.lastrowid, "description": desc, "completed": False, "reminder": reminder}
     return jsonify({"ok": True, "task": task}), 201
 
+@app.post("/tasks/bulk")
+def bulk_create_tasks():
+    data = request.get_json(silent=True)
+    items = data.get("tasks") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        abort(400, description="tasks must be a non-empty list")
+    rows = []
+    for item in items:
+        desc = item.get("description") if isinstance(item, dict) else None
+        if not isinstance(desc, str) or not desc.strip():
+            abort(400, description="description is required")
+        desc = desc.strip()
+        reminder = item.get("reminder")
+        if reminder is not None and not isinstance(reminder, str):
+            abort(400, description="Invalid reminder format.")
+        rows.append((desc, 0, iso_or_none(reminder)))
+    db = get_db()
+    # Take the write lock up front so the new ids are all above start_id
+    with transaction(db, "IMMEDIATE"):
+        start_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+        db.executemany(
+            "INSERT INTO tasks (description, completed, reminder) VALUES (?, ?, ?)",
+            rows
+        )
+        created = db.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE id > ? ORDER BY id ASC",
+            (start_id,)
+        ).fetchall()
+    return jsonify({"ok": True, "tasks": [row_to_dict(r) for r in created]}), 201
+
 @app.get("/tasks")
 def list_tasks():
-    with get_db() as db:
-        rows = db.execute("SELECT * FROM tasks ORDER BY id ASC").fetchall()
-    return jsonify({"ok": True, "tasks": [row_to_dict(r) for r in rows]}), 200
+    # Read the version before the rows: a write landing in between can only
+    # make this ETag stale-looking, never hide the write from the client
+    etag = tasks_etag()
+    if request.if_none_match.contains_weak(etag):
+        return with_tasks_etag(app.response_class(status=304), etag)
+
+    # Plain tuples are cheaper than sqlite3.Row on the biggest read
+    cur = get_db().cursor()
+    cur.row_factory = None
+    rows = cur.execute(f"SELECT {TASK_COLUMNS} FROM tasks ORDER BY id ASC").fetchall()
+    tasks = [{"id": r[0], "description": r[1], "completed": r[2], "reminder": r[3]} for r in rows]
+    return with_tasks_etag(jsonify({"ok": True, "tasks": tasks}), etag), 200
 
 @app.patch("/tasks/<int:task_id>")
 def update_task(task_id: int):
-    with get_db() as db:
-        row = db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-        if not row:
-            abort(404)
-        data = request.get_json(silent=True) or request.form or {}
-        completed = row["completed"]
-        description = row["description"]
-        reminder = row["reminder"]
-
-        if "completed" in data:
-            completed = 1 if data["completed"] else 0
-        if "description" in data and isinstance(data["description"], str):
-            desc = data["description"].strip()
-            if desc:
-                description = desc
-        if "reminder" in data:
+    data = request_payload()
+    sets, params = [], []
+    if "completed" in data:
+        sets.append("completed=?")
+        params.append(1 if data["completed"] else 0)
+    if "description" in data and isinstance(data["description"], str):
+        desc = data["description"].strip()
+        if desc:
+            sets.append("description=?")
+            params.append(desc)
+    db = get_db()
+    if "reminder" in data:
+        try:
             reminder = iso_or_none(data["reminder"])
-
-        db.execute(
-            "UPDATE tasks SET description=?, completed=?, reminder=? WHERE id=?",
-            (description, completed, reminder, task_id)
-        )
-        updated = db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+        except BadRequest:
+            # A missing task is reported as 404 before a bad reminder
+            if not db.execute("SELECT 1 FROM tasks WHERE id=?", (task_id,)).fetchone():
+                abort(404)
+            raise
+        sets.append("reminder=?")
+        params.append(reminder)
+
+    if sets:
+        with transaction(db):
+            updated = db.execute(
+                f"UPDATE tasks SET {', '.join(sets)} WHERE id=? "
+                f"RETURNING {TASK_COLUMNS}",
+                (*params, task_id)
+            ).fetchone()
+    else:
+        updated = db.execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE id=?", (task_id,)
+        ).fetchone()
+    if not updated:
+        abort(404)
     return jsonify({"ok": True, "task": row_to_dict(updated)}), 200
 
 @app.delete("/tasks/<int:task_id>")
 def delete_task(task_id: int):
     global last_deleted_task
-    with get_db() as db:
-        row = db.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-        if not row:
-            abort(404)
-        last_deleted_task = row_to_dict(row)
-        db.execute("DELETE FROM tasks WHERE id=?", (task_id,))
+    db = get_db()
+    # One statement, so the transaction never has to upgrade a read to a write
+    with transaction(db):
+        row = db.execute(
+            f"DELETE FROM tasks WHERE id=? RETURNING {TASK_COLUMNS}", (task_id,)
+        ).fetchone()
+    if not row:
+        abort(404)
+    last_deleted_task = row_to_dict(row)
     return jsonify({"ok": True, "deletedTaskId": task_id}), 200
 
 @app.route("/tasks/reset", methods=["DELETE", "POST"])
 def reset_all_tasks():
     global last_deleted_task
-    with get_db() as db:
+    db = get_db()
+    with transaction(db):
         db.execute("DELETE FROM tasks")
     last_deleted_task = None
     return jsonify({"ok": True, "message": "All tasks cleared"}), 200
@@ -150,32 +302,45 @@ def undo_delete():
     global last_deleted_task
     if not last_deleted_task:
         return jsonify({"ok": False, "message": "Nothing to undo"}), 200
-    with get_db() as db:
+    db = get_db()
+    with transaction(db):
         cur = db.execute(
             "INSERT INTO tasks (description, completed, reminder) VALUES (?, ?, ?)",
             (last_deleted_task["description"], int(last_deleted_task["completed"]), last_deleted_task["reminder"])
         )
-        restored_id = cur.lastrowid
-        restored = db.execute("SELECT * FROM tasks WHERE id=?", (restored_id,)).fetchone()
+    restored = {**last_deleted_task, "id": cur.lastrowid}
     last_deleted_task = None
-    return jsonify({"ok": True, "task": row_to_dict(restored)}), 200
+    return jsonify({"ok": True, "task": restored}), 200
 
 # ===== Chat/NLP =====
+def get_openai():
+    # Imported on first use: the SDK and its dependencies are heavy and
+    # nothing on the request path needs them yet
+    import openai
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    return openai
+
 def extract_message_payload() -> str:
-    data = request.get_json(silent=True)
-    if isinstance(data, dict) and "message" in data:
-        return data.get("message", "")
-    if request.form and "message" in request.form:
-        return request.form.get("message", "")
-    return ""
+    return request_payload().get("message", "")
+
+def extract_reminder(text: str) -> Optional[str]:
+    if not dateparser:
+        return None
+    try:
+        dt = dateparser.parse(text, **_FUZZY_KWARGS)
+    except Exception:
+        return None
+    return dt.isoformat() if dt else None
 
 def parse_chat_message(message_raw: str) -> dict:
     message = message_raw.strip()
     if not message:
         return {"function": None, "reply": "Hi! I didn't catch that. Please type something."}
 
+    low = message.lower()
+
     # Greeting
-    if message.lower() in ["hi", "hello", "hey"]:
+    if low in _GREETINGS:
         reply_text = (
             "Hi! 😊 I can help you manage tasks:\n"
             "1. Add task\n"
@@ -187,43 +352,37 @@ def parse_chat_message(message_raw: str) -> dict:
         )
         return {"function": None, "reply": reply_text}
 
-    reminder = None
-    if dateparser:
-        try:
-            dt = dateparser.parse(message, fuzzy=True)
-            if dt:
-                reminder = dt.isoformat()
-        except Exception:
-            reminder = None
-
-    # Add task
-    match = re.match(r"add (.+)", message, re.IGNORECASE)
-    if match:
+    match = _CHAT_RE.search(low)
+    command = match.lastgroup if match else None
+
+    # Add task (only this command uses a reminder, so the date parser runs here)
+    if command == "add":
+        # Take the description from the original text to keep its case; the
+        # "add " prefix is ASCII, and (.+) stops at the first newline
+        description = message[match.start("description"):].partition("\n")[0].strip()
         return {
             "function": "addTask",
-            "arguments": {"description": match.group(1).strip(), "reminder": reminder}
+            "arguments": {"description": description, "reminder": extract_reminder(description)}
         }
 
     # View tasks
-    if re.search(r"view", message, re.IGNORECASE):
+    if command == "view":
         return {"function": "viewTasks", "arguments": {}}
 
     # Complete task (user refers to task number shown in UI, not DB id)
-    match = re.match(r"complete task (\d+)", message, re.IGNORECASE)
-    if match:
-        return {"function": "completeTask", "arguments": {"task_number": int(match.group(1))}}
+    if command == "complete":
+        return {"function": "completeTask", "arguments": {"task_number": int(match.group("complete_number"))}}
 
     # Delete task (user refers to task number shown in UI)
-    match = re.match(r"delete task (\d+)", message, re.IGNORECASE)
-    if match:
-        return {"function": "deleteTask", "arguments": {"task_number": int(match.group(1))}}
+    if command == "delete":
+        return {"function": "deleteTask", "arguments": {"task_number": int(match.group("delete_number"))}}
 
     # Undo delete
-    if re.search(r"undo delete", message, re.IGNORECASE):
+    if command == "undo":
         return {"function": "undoDelete", "arguments": {}}
 
     # Reset all
-    if re.search(r"reset task", message, re.IGNORECASE):
+    if command == "reset":
         return {"function": "resetAll", "arguments": {}}
 
     return {"function": None, "reply": "I can help with 'add task', 'view tasks', 'complete task', 'delete task', 'undo delete', 'reset tasks'."}
@@ -241,6 +400,11 @@ def chat():
 # ===== Run =====
 if __name__ == "__main__":
     init_db()
-    app.run(debug=True)
+    if os.getenv("FLASK_DEBUG") == "1":
+        app.run(debug=True)
+    else:
+        from waitress import serve
+        serve(app, host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", 5000)),
+              threads=int(os.getenv("THREADS", 8)))
 
 